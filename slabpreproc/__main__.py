@@ -59,12 +59,23 @@ def main():
     parser.add_argument('--ses', required=True, help='Session ID without ses- prefix')
     parser.add_argument('--antsthreads', required=False, type=int, default=2, choices=range(1, 9),
                         help="Max number of threads allowed for ANTs/ITK modules")
+    parser.add_argument('--nprocs', required=False, type=int, default=1,
+                        help="Number of parallel nipype processes (MultiProc plugin if > 1) [1]")
+    parser.add_argument('--bidsdb', required=False, default=None,
+                        help="Persistent PyBIDS database directory, reused by later runs (delete to reindex)")
     parser.add_argument('--melodic', action='store_true', default=False, help="Run Melodic ICA")
+    parser.add_argument('--melodic-noreport', action='store_true', default=False,
+                        help="Skip Melodic stats images and HTML report")
+    parser.add_argument('--reuse-report', action='store_true', default=False,
+                        help="Keep existing summary report if its inputs are unchanged")
     parser.add_argument('--debug', action='store_true', default=False, help="Debugging flag")
 
     # Parse command line arguments
     args = parser.parse_args()
 
+    if args.nprocs < 1:
+        parser.error('--nprocs must be at least 1')
+
     # BIDS dataset directory
     bids_dir = op.realpath(args.bidsdir)
 
@@ -113,7 +124,11 @@ def main():
     print(f'Subject ID       : {subj_id}')
     print(f'Session ID       : {sess_id}')
     print(f'Max ANTs threads : {args.antsthreads}')
+    print(f'Nipype processes : {args.nprocs}')
+    print(f'PyBIDS database  : {args.bidsdb}')
     print(f'Run Melodic ICA  : {args.melodic}')
+    print(f'Melodic report   : {not args.melodic_noreport}')
+    print(f'Reuse report     : {args.reuse_report}')
     print(f'Debug mode       : {args.debug}')
 
     # Get T1 and T2 templates and subcortical labels from templateflow repo
@@ -182,7 +197,7 @@ def main():
         sys.exit(1)
 
     # Construct BIDS layout object for this dataset
-    layout = gen_bids_layout(bids_dir)
+    layout = gen_bids_layout(bids_dir, database_path=args.bidsdb)
 
     # Get list of available BOLD magnitude images for this subj/sess
     bold_mag_filter = {
@@ -211,6 +226,10 @@ def main():
         if "rec-norm" in img.filename:
             ses_t2w_head_path = op.join(img.dirname, img.filename)
 
+    # SE-EPI fieldmap metadata keyed by pathname
+    # Fieldmaps are typically shared by several BOLD series in a session
+    seepi_meta_cache = {}
+
     #
     # Within session BOLD series loop
     #
@@ -238,20 +257,20 @@ def main():
         bold_work_dir = op.join(work_dir, bold_stub)
         os.makedirs(bold_work_dir, exist_ok=True)
 
-        # Find corresponding SBRef mag image
+        # Find corresponding SBRef mag and phase images in a single query
         bids_filter = {
             'datatype': 'func',
             'suffix': 'sbref',
-            'part': 'mag',
+            'part': ['mag', 'phase'],
             'extension': ['.nii', '.nii.gz'],
             'task': task_id
         }
-        sbref_mag = layout.get(subject=subj_id, session=sess_id, **bids_filter)
-        assert len(sbref_mag) > 0, print('No SBRef mag image found for this BOLD series')
+        sbref_list = layout.get(subject=subj_id, session=sess_id, **bids_filter)
 
-        # Find corresponding SBRef phase image
-        bids_filter['part'] = 'phase'
-        sbref_phs = layout.get(subject=subj_id, session=sess_id, **bids_filter)
+        # Split by part entity
+        sbref_mag = [f for f in sbref_list if f.entities.get('part') == 'mag']
+        assert len(sbref_mag) > 0, print('No SBRef mag image found for this BOLD series')
+        sbref_phs = [f for f in sbref_list if f.entities.get('part') == 'phase']
         assert len(sbref_phs) > 0, print('No SBRef phase image found for this BOLD series')
 
         # SBRef metadata (should only be one)
@@ -277,15 +296,20 @@ def main():
                 seepi_mag_list.append(fmap_pname)
 
                 # Capture SE-EPI metadata from magnitude images only
-                # Get the BIDSFile object from the mag fieldmap pathname
-                fm = layout.get_file(fmap_pname)
-                seepi_meta_list.append(fm.get_metadata())
+                # Get the BIDSFile object from the mag fieldmap pathname on first use
+                if fmap_pname not in seepi_meta_cache:
+                    seepi_meta_cache[fmap_pname] = layout.get_file(fmap_pname).get_metadata()
+                seepi_meta_list.append(seepi_meta_cache[fmap_pname])
             
             if 'part-phase' in fmap_pname:
                 seepi_phs_list.append(fmap_pname)
 
         # Build the slab fMRI workflow
-        func_wf = build_func_wf(bold_work_dir, slab_der_dir, bold_meta, args.melodic, args.antsthreads)
+        func_wf = build_func_wf(
+            bold_work_dir, slab_der_dir, bold_meta, args.melodic, args.antsthreads,
+            melodic_report=not args.melodic_noreport,
+            reuse_report=args.reuse_report
+        )
 
         # Supply inputs to func_wf
         func_wf.inputs.inputnode.subject_id = subj_id
@@ -311,15 +335,27 @@ def main():
 
         # Run workflow
         # Outputs are stored in the BIDS derivatives/slabpreproc folder tree
-        func_wf.run()
-
-
-def gen_bids_layout(bids_dir):
+        # Independent nodes (eg QC, reporting, derivatives sorting) run concurrently with MultiProc
+        # Multithreaded ANTs nodes may request more than --nprocs processors (--antsthreads)
+        # Let MultiProc clamp those jobs to the available processors rather than abort the run
+        if args.nprocs > 1:
+            func_wf.run(
+                plugin='MultiProc',
+                plugin_args={'n_procs': args.nprocs, 'raise_insufficient': False}
+            )
+        else:
+            func_wf.run()
+
+
+def gen_bids_layout(bids_dir, database_path=None):
     """
     Create the BIDS layout object for this dataset
 
     :param bids_dir: str, pathlike
         Root directory of BIDS dataset
+    :param database_path: str, pathlike
+        Optional PyBIDS SQLite database directory. An existing database is loaded
+        instead of reindexing the dataset
     :return: layout, BIDSLayout
         BIDS layout object
     """
@@ -341,11 +377,20 @@ def gen_bids_layout(bids_dir):
         ),
     )
 
+    # Reuse a persistent index if one has already been built
+    if database_path:
+        database_path = op.realpath(database_path)
+
     # Construct layout using indexer
-    print(f'\nIndexing {bids_dir}')
+    if database_path and op.isdir(database_path):
+        print(f'\nLoading BIDS index from {database_path}')
+    else:
+        print(f'\nIndexing {bids_dir}')
     layout = bids.BIDSLayout(
         str(bids_dir),
-        indexer=bids_indexer
+        indexer=bids_indexer,
+        database_path=database_path,
+        reset_database=False
     )
     print('Indexing Complete')
 
@@ -20,6 +20,108 @@ from nipype.interfaces.base import (
 )
 
 
+def _pol2cart(mag, phs_rad, re, im):
+    """
+    Polar to cartesian complex conversion into preallocated output arrays
+    Computed one volume at a time so the working set stays in cache
+
+    :param mag: numpy array
+        Magnitude image, time last
+    :param phs_rad: numpy array
+        Phase image in radians, same shape as mag
+    :param re: numpy array
+        Real output buffer, same shape as mag
+    :param im: numpy array
+        Imaginary output buffer, same shape as mag. May alias phs_rad
+    :return: tuple of numpy arrays
+        Real and imaginary arrays
+    """
+
+    for tc in range(mag.shape[-1]):
+        mag_t, phs_t, re_t, im_t = mag[..., tc], phs_rad[..., tc], re[..., tc], im[..., tc]
+        np.cos(phs_t, out=re_t)
+        np.sin(phs_t, out=im_t)
+        re_t *= mag_t
+        im_t *= mag_t
+
+    return re, im
+
+
+def _cart2pol(re, im, mag, phs_rad):
+    """
+    Cartesian to polar complex conversion into preallocated output arrays
+    Computed one volume at a time so the working set stays in cache
+
+    :param re: numpy array
+        Real image, time last
+    :param im: numpy array
+        Imaginary image, same shape as re
+    :param mag: numpy array
+        Magnitude output buffer, same shape as re
+    :param phs_rad: numpy array
+        Phase output buffer (radians), same shape as re
+    :return: tuple of numpy arrays
+        Magnitude and phase arrays
+    """
+
+    for tc in range(re.shape[-1]):
+        re_t, im_t = re[..., tc], im[..., tc]
+        np.hypot(re_t, im_t, out=mag[..., tc])
+        np.arctan2(im_t, re_t, out=phs_rad[..., tc])
+
+    return mag, phs_rad
+
+
+def _unwrap_wrapped_inplace(phi):
+    """
+    Temporal unwrap of wrapped phase timeseries in place
+    Equivalent to np.unwrap(phi, axis=1) for phase already wrapped to [-pi, pi],
+    where successive differences need at most a single 2 pi correction
+
+    :param phi: numpy array
+        Voxel x time wrapped phase (radians), modified in place
+    :return: numpy array
+        Voxel x time unwrapped phase (radians)
+    """
+
+    # Signed count of 2 pi jumps between successive timepoints
+    d = np.diff(phi, axis=1)
+    n_jumps = np.less(d, -np.pi).view(np.int8) - np.greater(d, np.pi).view(np.int8)
+
+    # Accumulate corrections along time and apply
+    phi[:, 1:] += (2.0 * np.pi) * np.cumsum(n_jumps, axis=1, dtype=np.int32).astype(phi.dtype)
+
+    return phi
+
+
+def _phase_difference_block(mag, phi_w):
+    """
+    Temporally unwrapped phase difference with first volume for a block of voxel timeseries
+
+    :param mag: numpy array
+        Voxel x time magnitude block
+    :param phi_w: numpy array
+        Voxel x time wrapped phase block (radians)
+    :return: numpy array
+        Voxel x time unwrapped phase difference block (radians)
+    """
+
+    # Complex division by first volume
+    z = mag * np.exp(1j * phi_w)
+    z_0 = z[:, :1]
+    nonzero = np.abs(z_0[:, 0]) > 0.0
+
+    # Calculate temporal phase difference with first volume by complex division
+    dphi = np.zeros(mag.shape, dtype=mag.dtype)
+    dphi[nonzero] = np.angle(z[nonzero] / z_0[nonzero])
+
+    # Zero out NaNs
+    dphi[np.isnan(dphi)] = 0.0
+
+    # Temporally phase unwrap
+    return _unwrap_wrapped_inplace(dphi)
+
+
 class Pol2CartInputSpec(BaseInterfaceInputSpec):
 
     bold_mag = File(
@@ -53,15 +155,17 @@ class Pol2Cart(BaseInterface):
 
     def _run_interface(self, runtime):
 
-        # Load 4D mag and phase BOLD images
+        # Load 4D mag and phase BOLD images in single precision
+        # Halves memory traffic and doubles SIMD lane width for the trig kernels
         bold_mag_nii = nib.load(self.inputs.bold_mag)
-        bold_mag = bold_mag_nii.get_fdata()
+        bold_mag = bold_mag_nii.get_fdata(dtype=np.float32, caching='unchanged')
         bold_phs_rad_nii = nib.load(self.inputs.bold_phs_rad)
-        bold_phs_rad = bold_phs_rad_nii.get_fdata()
+        bold_phs_rad = bold_phs_rad_nii.get_fdata(dtype=np.float32, caching='unchanged')
 
         # Calculate real and imaginary channels
-        bold_z = bold_mag * np.exp(1.0j * bold_phs_rad)
-        bold_re, bold_im = np.real(bold_z), np.imag(bold_z)
+        # Phase array is reused as the imaginary output buffer
+        bold_re = np.empty_like(bold_mag)
+        bold_re, bold_im = _pol2cart(bold_mag, bold_phs_rad, bold_re, bold_phs_rad)
 
         # Save cartesian complex BOLD image
         bold_re_nii = nib.Nifti1Image(bold_re, affine=bold_mag_nii.affine, header=bold_mag_nii.header)
@@ -121,15 +225,14 @@ class Cart2Pol(BaseInterface):
 
     def _run_interface(self, runtime):
 
-        # Load 4D real and imag BOLD images
+        # Load 4D real and imag BOLD images in single precision
         bold_re_nii = nib.load(self.inputs.bold_re)
-        bold_re = bold_re_nii.get_fdata()
+        bold_re = bold_re_nii.get_fdata(dtype=np.float32, caching='unchanged')
         bold_im_nii = nib.load(self.inputs.bold_im)
-        bold_im = bold_im_nii.get_fdata()
+        bold_im = bold_im_nii.get_fdata(dtype=np.float32, caching='unchanged')
 
-        # Calculate real and imaginary channels
-        bold_z = bold_re + 1.0j * bold_im
-        bold_mag, bold_phs_rad = np.abs(bold_z), np.angle(bold_z, deg=False)
+        # Calculate magnitude and phase channels
+        bold_mag, bold_phs_rad = _cart2pol(bold_re, bold_im, np.empty_like(bold_re), np.empty_like(bold_re))
 
         # Save polar complex BOLD image
         bold_mag_nii = nib.Nifti1Image(bold_mag, affine=bold_re_nii.affine, header=bold_re_nii.header)
@@ -180,31 +283,32 @@ class ComplexPhaseDifference(BaseInterface):
     input_spec = ComplexPhaseDifferenceInputSpec
     output_spec = ComplexPhaseDifferenceOutputSpec
 
+    # Voxel timeseries per processing block
+    _block_size = 8192
+
     def _run_interface(self, runtime):
         # Load 3D x time mag images
         mag_nii = nib.load(self.inputs.mag)
-        mag = mag_nii.get_fdata()
+        mag = mag_nii.get_fdata(dtype=np.float32, caching='unchanged')
 
         # Load 3D x time wrapped phase images (radians)
         phi_w_nii = nib.load(self.inputs.phi_w)
-        phi_w = phi_w_nii.get_fdata()
+        phi_w = phi_w_nii.get_fdata(dtype=np.float32, caching='unchanged')
 
-        # Complex division by first volume
-        z_0 = mag[..., 0] * np.exp(1j * phi_w[..., 0])
-        nonzero = np.abs(z_0) > 0.0
-
-        # Calculate temporal phase difference with first volume by complex division
-        dphi = np.zeros_like(phi_w)
+        # Voxel x time views of the (Fortran ordered) 4D images. No copies made
         nt = mag.shape[3]
-        for tc in range(nt):
-            z_t = mag[nonzero, tc] * np.exp(1j * phi_w[nonzero, tc])
-            dphi[nonzero, tc] = np.angle(z_t / z_0[nonzero])
-
-        # Zero out NaNs
-        dphi[np.isnan(dphi)] = 0.0
-
-        # Temporally phase unwrap
-        dphi_uw = np.unwrap(dphi, axis=3)
+        mag_vt = mag.reshape(-1, nt, order='F')
+        phi_w_vt = phi_w.reshape(-1, nt, order='F')
+
+        # Preallocated output with matching voxel x time view
+        dphi_uw = np.zeros(mag.shape, dtype=np.float32, order='F')
+        dphi_uw_vt = dphi_uw.reshape(-1, nt, order='F')
+
+        # Process blocks of voxel timeseries so that complex division and temporal
+        # unwrapping of each block happen while it is still in cache
+        for v0 in range(0, mag_vt.shape[0], self._block_size):
+            v1 = v0 + self._block_size
+            dphi_uw_vt[v0:v1] = _phase_difference_block(mag_vt[v0:v1], phi_w_vt[v0:v1])
 
         # Save unwrapped temporal phase difference image (radians)
         dphi_uw_nii = nib.Nifti1Image(dphi_uw, affine=phi_w_nii.affine, header=phi_w_nii.header)
@@ -9,25 +9,122 @@ DATES  : 2022-07-23 JMT From scratch
 import os
 import os.path as op
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 import bids
 from nipype.interfaces.base import (
     BaseInterface,
     BaseInterfaceInputSpec,
+    DynamicTraitedSpec,
     traits,
     File,
     Directory,
     InputMultiPath,
     InputMultiObject,
-    TraitedSpec
+    TraitedSpec,
+    isdefined
 )
+from nipype.interfaces.io import add_traits
 
 """
 Populate correct derivatives subfolder with input data file
 """
 
 
-class DerivativesSorterInputSpec(BaseInterfaceInputSpec):
+# Linux FICLONE ioctl request code (copy-on-write reflink on Btrfs/XFS)
+_FICLONE = 0x40049409
+
+
+def _fast_copy(src, dst):
+    """
+    Copy file from src to dst, preferring a copy-on-write reflink (Btrfs/XFS)
+    and falling back to shutil.copyfile (kernel sendfile on Linux)
+    Never hardlinks - sources include the shared TemplateFlow cache and nipype
+    work dirs, and derivatives must be independent inodes
+
+    :param src: str, pathlike
+        Source file path
+    :param dst: str, pathlike
+        Destination file path
+    :return: str, pathlike
+        Destination file path
+    """
+
+    # Replace any previously sorted file rather than writing through an existing link
+    if op.lexists(dst):
+        os.remove(dst)
+
+    if fcntl is not None:
+        try:
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+            return dst
+        except OSError:
+            pass
+
+    shutil.copyfile(src, dst)
+
+    return dst
+
+
+@lru_cache(maxsize=1024)
+def _parse_file_entities(pname):
+    """
+    Cached BIDS entity parse of a pathname
+
+    :param pname: str
+        BIDS file pathname
+    :return: dict
+        BIDS entities (treat as read-only - shared between callers)
+    """
+    return bids.layout.parse_file_entities(pname)
+
+
+@lru_cache(maxsize=1024)
+def _strip_extensions(bname):
+    """
+    Strip maximum of two extensions from a file basename
+    Handles both .nii and .nii.gz extensions
+
+    :param bname: str
+        File basename
+    :return: str
+        Basename without extensions
+    """
+    bname, _ = op.splitext(bname)
+    bname, _ = op.splitext(bname)
+    return bname
+
+
+def _nipype_aux_ignore(root_dname):
+    """
+    Build a copytree ignore callable which skips Nipype auxiliary files
+    ('_*' and '*.pklz') in the top level of a node output folder only
+
+    :param root_dname: str, pathlike
+        Top level folder being copied
+    :return: callable
+        copytree ignore function
+    """
+
+    aux_patterns = shutil.ignore_patterns('_*', '*.pklz')
+    root_dname = op.realpath(root_dname)
+
+    def _ignore(dname, names):
+        if op.realpath(dname) == root_dname:
+            return aux_patterns(dname, names)
+        return set()
+
+    return _ignore
+
+
+class DerivativesSorterInputSpec(DynamicTraitedSpec, BaseInterfaceInputSpec):
 
     deriv_dir = Directory(
         desc="BIDS derivatives folder",
@@ -40,8 +137,8 @@ class DerivativesSorterInputSpec(BaseInterfaceInputSpec):
     file_list = InputMultiPath(
         File(exists=True),
         copyfile=False,
-        desc='List of files to sort into derivatives folder',
-        mandatory=True
+        desc='List of files to sort into derivatives folder (ignored if numinputs > 0)',
+        mandatory=False
     )
 
     file_sort_dicts = InputMultiObject(
@@ -63,6 +160,12 @@ class DerivativesSorterInputSpec(BaseInterfaceInputSpec):
         desc="List of sorting info dictionaries corresponding to folder_list",
     )
 
+    num_threads = traits.Int(
+        8,
+        usedefault=True,
+        desc="Number of concurrent file copy threads"
+    )
+
 
 class DerivativesSorterOutputSpec(TraitedSpec):
 
@@ -75,6 +178,25 @@ class DerivativesSorter(BaseInterface):
     input_spec = DerivativesSorterInputSpec
     output_spec = DerivativesSorterOutputSpec
 
+    def __init__(self, numinputs=0, **inputs):
+        super().__init__(**inputs)
+
+        # Files may be supplied through individual in1..inN inputs (one per file sort dict)
+        # instead of file_list, so no separate Merge node is needed upstream
+        # File traits so that upstream content changes still rehash this node
+        self._numinputs = numinputs
+        add_traits(self.inputs, [f'in{i}' for i in range(1, numinputs + 1)], File(exists=True))
+
+    def _file_pairs(self):
+        """
+        Pair input files with their sort dicts, skipping undefined inputs
+        """
+        if self._numinputs > 0:
+            file_list = [getattr(self.inputs, f'in{i}') for i in range(1, self._numinputs + 1)]
+        else:
+            file_list = self.inputs.file_list if isdefined(self.inputs.file_list) else []
+        return [(f, d) for f, d in zip(file_list, self.inputs.file_sort_dicts) if isdefined(f)]
+
     def _run_interface(self, runtime):
 
         #
@@ -86,7 +208,7 @@ class DerivativesSorter(BaseInterface):
         source_bname = op.basename(source_fname)
 
         # Get entities from source_file
-        keys = bids.layout.parse_file_entities(source_fname)
+        keys = _parse_file_entities(source_fname)
         subj_id = keys['subject']
         sess_id = keys['session']
         task_id = keys['task']
@@ -96,19 +218,27 @@ class DerivativesSorter(BaseInterface):
 
         # Strip maximum of two extensions
         # Handles both .nii and nii.gz extensions
-        source_bname, _ = op.splitext(source_bname)
-        source_bname, _ = op.splitext(source_bname)
+        source_bname = _strip_extensions(source_bname)
 
         # Output derivatives root folder
         deriv_dname = self.inputs.deriv_dir
         subjsess_deriv_dname = op.join(deriv_dname, 'sub-' + subj_id, 'ses-' + sess_id)
 
+        # Safe create each unique data type subfolder (eg preproc, qc, melodic) once
+        file_pairs = self._file_pairs()
+        sort_pairs = file_pairs + list(zip(self.inputs.folder_list, self.inputs.folder_sort_dicts))
+        datatype_dnames = {op.join(subjsess_deriv_dname, sort_dict['DataType']) for _, sort_dict in sort_pairs}
+        for datatype_out_dname in datatype_dnames:
+            os.makedirs(datatype_out_dname, exist_ok=True)
+
+        # Copy plan of (source, destination) file pairs
+        copy_plan = []
+
         # Loop over all input files and associated sorting dicts
-        for in_pname, sort_dict in zip(self.inputs.file_list, self.inputs.file_sort_dicts):
+        for in_pname, sort_dict in file_pairs:
 
-            # Safe create data type subfolder (eg preproc)
+            # Data type subfolder (eg preproc)
             datatype_out_dname = op.join(subjsess_deriv_dname, sort_dict['DataType'])
-            os.makedirs(datatype_out_dname, exist_ok=True)
 
             # Output file path
             # Construction depends on whether preproc output or atlas templates are being copied to derivatives
@@ -137,40 +267,46 @@ class DerivativesSorter(BaseInterface):
                 else:
                     out_pname = out_pstub + old_ext
 
-            # Copy input file to deriv_dname/subj_dir/sess_dir/out_file
-            shutil.copyfile(in_pname, out_pname)
+            # Queue copy of input file to deriv_dname/subj_dir/sess_dir/out_file
+            copy_plan.append((in_pname, out_pname))
+
+        # Copies are independent and I/O bound (GIL released during file I/O)
+        # so overlap them in a small thread pool
+        # shutil.copyfile already uses zero-copy os.sendfile on Linux
+        with ThreadPoolExecutor(max_workers=max(1, self.inputs.num_threads)) as pool:
+
+            copy_jobs = [pool.submit(_fast_copy, in_pname, out_pname) for in_pname, out_pname in copy_plan]
 
-        # Output folder handling
-        # Copying nipype output folders (eg melodic) to derivatives
+            # Output folder handling
+            # Copying nipype output folders (eg melodic) to derivatives
 
-        # Loop over all input folders and associated sorting dicts
-        if len(self.inputs.folder_list) > 0:
+            # Loop over all input folders and associated sorting dicts
+            if len(self.inputs.folder_list) > 0:
 
-            for in_dname, sort_dict in zip(self.inputs.folder_list, self.inputs.folder_sort_dicts):
+                for in_dname, sort_dict in zip(self.inputs.folder_list, self.inputs.folder_sort_dicts):
 
-                # Safe create data type subfolder (eg melodic)
-                datatype_out_dname = op.join(subjsess_deriv_dname, sort_dict['DataType'])
-                os.makedirs(datatype_out_dname, exist_ok=True)
+                    # Data type subfolder (eg melodic)
+                    datatype_out_dname = op.join(subjsess_deriv_dname, sort_dict['DataType'])
 
-                # Output subfolder path. Replace current suffix (eg _bold) with new suffix (eg _melodic)
-                new_suffix = sort_dict['NewSuffix']
-                out_pname = op.join(datatype_out_dname, source_bname.replace(old_suffix, new_suffix))
+                    # Output subfolder path. Replace current suffix (eg _bold) with new suffix (eg _melodic)
+                    new_suffix = sort_dict['NewSuffix']
+                    out_pname = op.join(datatype_out_dname, source_bname.replace(old_suffix, new_suffix))
 
-                # Copy nipype folder to deriv_dname/subj_dir/sess_dir/task_out_dname
-                print(f'  Copying {in_dname}')
-                print(f'  to {out_pname}')
-                shutil.copytree(in_dname, out_pname, dirs_exist_ok=True)
+                    # Copy nipype folder to deriv_dname/subj_dir/sess_dir/task_out_dname
+                    # Nipype auxiliary files ('_*' and '*.pklz') in the top level are skipped during the copy
+                    # copytree walks and creates the folder tree, file copies are queued on the pool
+                    print(f'  Copying {in_dname}')
+                    print(f'  to {out_pname}')
+                    shutil.copytree(
+                        in_dname, out_pname,
+                        ignore=_nipype_aux_ignore(in_dname),
+                        copy_function=lambda src, dst: copy_jobs.append(pool.submit(shutil.copy2, src, dst)),
+                        dirs_exist_ok=True
+                    )
 
-                # 2024-07-25 JMT Skip aux file removal - rmtree throwing errors for melodic _report tree
-                # Remove all Nipype auxiliary files from output folder ('_*' and '*.pklz')
-                # fnames = glob(op.join(out_pname, '_*')) + glob(op.join(out_pname, '*.pklz'))
-                # for fname in fnames:
-                #     if op.isfile(fname):
-                #         os.remove(fname)
-                #     elif op.isdir(fname):
-                #         shutil.rmtree(fname)
-                #     else:
-                #         pass
+            # Wait for all copies and raise any copy errors
+            for job in copy_jobs:
+                job.result()
 
         return runtime
 
@@ -23,6 +23,70 @@ from nipype.interfaces.base import (
 )
 
 
+def _median_inplace(x):
+    """
+    Exact median of a 1D array by quickselect
+    Partitions x in place, so pass a scratch copy
+
+    :param x: numpy array
+        1D array of values (reordered on return)
+    :return: float
+        Median value (nan for an empty array, as np.median)
+    """
+
+    n = x.size
+    k = n // 2
+
+    # Empty in-signal mask
+    if n == 0:
+        return np.nan
+
+    if n % 2:
+        x.partition(k)
+        return x[k]
+
+    # Even count: mean of the two central order statistics
+    x.partition((k - 1, k))
+    return 0.5 * (x[k - 1] + x[k])
+
+
+def _dropout_kernel(sbref, seepiref):
+    """
+    Median normalized dropout estimate from SBRef and SE-EPI reference voxel values
+    All steps after the ratio are done in place in a single buffer
+
+    :param sbref: numpy array
+        1D SBRef brain voxel values
+    :param seepiref: numpy array
+        1D SE-EPI reference brain voxel values
+    :return: numpy array
+        1D dropout estimate in range [0, 1]
+    """
+
+    # Create conservative signal mask from mean BOLD and SE-EPI
+    # These images may be signal slabs embedded in the larger
+    # zero-filled template volume
+    sig_mask = np.logical_and(sbref > 0, seepiref > 0)
+
+    # Calculate dropout ratio
+    # Single buffer updated in place for all subsequent steps
+    dropout = np.add(seepiref, 1e-20)
+    np.divide(sbref, dropout, out=dropout)
+
+    # Normalize dropout to median non-zero signal assuming
+    # dropout regions account for less than half the brain volume
+    median_sig = _median_inplace(np.extract(sig_mask, dropout))
+    dropout /= median_sig
+
+    # Clamp dropout to range [0, 1]
+    np.clip(dropout, 0.0, 1.0, out=dropout)
+
+    # Invert intensity to represent dropout (rather than retained signal)
+    np.subtract(1.0, dropout, out=dropout)
+
+    return dropout
+
+
 class DropoutInputSpec(BaseInterfaceInputSpec):
     seepiref = File(
         desc='SE-EPI reference in template space',
@@ -57,40 +121,31 @@ class Dropout(BaseInterface):
 
         # Load temporal mean BOLD image
         sbref_nii = nib.load(self.inputs.sbref)
-        sbref_img = sbref_nii.get_fdata()
+        sbref_img = sbref_nii.get_fdata(dtype=np.float32, caching='unchanged')
 
         # Load mean SE-EPI image
         seepiref_nii = nib.load(self.inputs.seepiref)
-        seepiref_img = seepiref_nii.get_fdata()
+        seepiref_img = seepiref_nii.get_fdata(dtype=np.float32, caching='unchanged')
 
         # Load probabilistic brain mask image
         bmask_nii = nib.load(self.inputs.bmask)
-        bmask_img = bmask_nii.get_fdata()
+        bmask_img = bmask_nii.get_fdata(dtype=np.float32, caching='unchanged')
         brain_mask = bmask_img > 0.5
-        not_brain_mask = np.logical_not(brain_mask)
-
-        # Create conservative signal mask from mean BOLD and SE-EPI
-        # These images may be signal slabs embedded in the larger
-        # zero-filled template volume
-        sig_mask = np.logical_and(sbref_img > 0, seepiref_img > 0)
-        sig_mask = np.logical_and(sig_mask, brain_mask)
-
-        # Calculate masked dropout image
-        dropout_img = sbref_img / (seepiref_img + 1e-20)
 
-        # Normalize dropout to median non-zero signal assuming
-        # dropout regions account for less than half the brain volume
-        median_sig = np.median(dropout_img[sig_mask])
-        dropout_img = dropout_img / median_sig
+        # Only brain voxels contribute to the output, so gather them once
+        # and do all dropout arithmetic on the compact 1D brain voxel arrays
+        sbref_brain = sbref_img[brain_mask]
+        seepiref_brain = seepiref_img[brain_mask]
 
-        # Clamp dropout img to range [0, 1]
-        dropout_img = np.clip(dropout_img, 0.0, 1.0)
+        # Full volumes are no longer needed
+        del sbref_img, seepiref_img, bmask_img
 
-        # Invert intensity to represent dropout (rather than retained signal)
-        dropout_img = 1 - dropout_img
+        # Dropout estimate for brain voxels
+        dropout_brain = _dropout_kernel(sbref_brain, seepiref_brain)
 
-        # Set non-brain signal to 0.0
-        dropout_img[not_brain_mask] = 0.0
+        # Scatter back into the template volume. Non-brain signal is 0.0
+        dropout_img = np.zeros(brain_mask.shape, dtype=np.float32)
+        dropout_img[brain_mask] = dropout_brain
 
         # Save dropout image
         dropout_nii = nib.Nifti1Image(dropout_img, affine=sbref_nii.affine, header=sbref_nii.header)
@@ -27,6 +27,22 @@ Output full motion timeseries table as CSV with headers
 """
 
 
+def _as_columns(img):
+    """
+    Reshape a 3D or 4D image to a voxels x volumes matrix
+    Returns a view for Fortran-ordered arrays as loaded by nibabel
+
+    :param img: numpy array
+        3D or 4D image array
+    :return: numpy array
+        2D array with one column per volume
+    """
+
+    n_vols = img.shape[3] if img.ndim > 3 else 1
+
+    return img.reshape(-1, n_vols, order='F')
+
+
 class LabelStatsInputSpec(BaseInterfaceInputSpec):
 
     label_names = File(
@@ -60,57 +76,43 @@ class LabelStats(BaseInterface):
 
     def _run_interface(self, runtime):
 
-        # Load label names
-        label_names = pd.load_csv(self.inputs.label_names)
+        # Load label names (single column, no header)
+        label_names = pd.read_csv(self.inputs.label_names, header=None).iloc[:, 0].to_numpy()
 
         # Load labels image
         labels_nii = nib.load(self.inputs.labels)
-        labels_img = labels_nii.get_fdata()
+        labels_img = labels_nii.get_fdata(dtype=np.float32, caching='unchanged')
 
         # Load scalar image
         scalar_nii = nib.load(self.inputs.scalar)
-        scalar_img = scalar_nii.get_fdata()
+        scalar_img = scalar_nii.get_fdata(dtype=np.float32, caching='unchanged')
 
         # Get voxel volume in ul
         scalar_hdr = scalar_nii.header
         vox_vol_ul = np.prod(scalar_hdr.get_zooms()[:3])
 
-        # Adjust for image dimensionality
-        n_labels = labels_img.shape[3] if labels_img.ndim > 3 else 1
-        n_scalars = scalar_img.shape[3] if scalar_img.ndim > 3 else 1
-
-        df = pd.DataFrame(columns=['LabelName', 'WeightedMean', 'WeightedSum', 'WeightedVol'])
-
-        for lc in range(n_labels):
-
-            if n_labels > 1:
-                p = labels_img[..., lc]
-            else:
-                p = labels_img
-
-            # Normalization factor (sum of probs over volume)
-            psum = np.sum(p.flatten())
-
-            for sc in range(n_scalars):
+        # Canonical voxels x labels and voxels x scalars views
+        # Handles both 3D and 4D images
+        P = _as_columns(labels_img)
+        S = _as_columns(scalar_img)
+        n_labels, n_scalars = P.shape[1], S.shape[1]
 
-                if n_scalars > 1:
-                    s = scalar_img[..., sc]
-                else:
-                    s = scalar_img
+        # Normalization factor for each label (sum of probs over volume)
+        psum = P.sum(axis=0, dtype=np.float64)
 
-                # Stats for this label
-                row_dict = {
-                    'LabelName': label_names[lc],
-                    'WeightedMean': np.dot(s, p) / psum,
-                    'WeightedSum': psum,
-                    'WeightedVol': psum * vox_vol_ul
-                }
+        # Probability weighted sums for all scalar x label pairs in a single matrix product
+        wsum = S.T @ P
 
-                # Add new stats to dataframe
-                df.append(row_dict, ignore_index=True)
+        # Build stats table with one row per label x scalar (scalars vary fastest)
+        df = pd.DataFrame({
+            'LabelName': np.repeat(label_names[:n_labels], n_scalars),
+            'WeightedMean': (wsum / psum).ravel(order='F'),
+            'WeightedSum': np.repeat(psum, n_scalars),
+            'WeightedVol': np.repeat(psum * vox_vol_ul, n_scalars)
+        })
 
         # Save label stats dataframe to CSV file
-        df.save_csv(self._gen_outfile_name())
+        df.to_csv(self._gen_outfile_name(), index=False)
 
         return runtime
 
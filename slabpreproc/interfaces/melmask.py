@@ -19,6 +19,53 @@ from nipype.interfaces.base import (
 )
 
 
+def _percentile_inplace(x, q):
+    """
+    Percentile of a 1D array by quickselect with linear interpolation
+    Matches np.percentile default behavior. Partitions x in place, so pass a scratch copy
+
+    :param x: numpy array
+        1D array of values (reordered on return)
+    :param q: float
+        Percentile in range [0, 100]
+    :return: float
+        Percentile value
+    """
+
+    h = (x.size - 1) * q / 100.0
+    lo = int(np.floor(h))
+    hi = min(lo + 1, x.size - 1)
+
+    x.partition((lo, hi))
+
+    return x[lo] + (h - lo) * (x[hi] - x[lo])
+
+
+def _melmask_kernel(tmean, bmask, thr):
+    """
+    Melodic brain signal mask from tMean BOLD and probabilistic brain mask
+    Both comparisons are combined in place in a single boolean buffer
+
+    :param tmean: numpy array
+        tMean BOLD image
+    :param bmask: numpy array
+        Probabilistic brain mask image, same shape as tmean
+    :param thr: float
+        tMean BOLD signal threshold
+    :return: numpy array
+        uint8 (0/1) mask image
+    """
+
+    # tMean BOLD signal mask including non-brain tissue
+    mask = np.greater(tmean, thr)
+
+    # Restrict to brain
+    np.logical_and(mask, bmask > 0.5, out=mask)
+
+    # Reinterpret boolean mask bytes as uint8 (0/1) without a copy
+    return mask.view(np.uint8)
+
+
 class MelMaskInputSpec(BaseInterfaceInputSpec):
     tmean = File(
         desc='tMean BOLD image in template space',
@@ -47,25 +94,21 @@ class MelMask(BaseInterface):
 
         # Load tMean BOLD image
         tmean_nii = nib.load(self.inputs.tmean)
-        tmean_img = tmean_nii.get_fdata()
+        tmean_img = tmean_nii.get_fdata(dtype=np.float32, caching='unchanged')
 
         # Slab mask (tMean BOLD signal > 0)
         # The template-space image is whole-brain, so many voxels may be outside the slab
         slab_mask = tmean_img > 0
 
         # Set signal threshold at 10% of 98th percentile
-        thr = np.percentile(tmean_img[slab_mask], 98.0) * 0.1
-
-        # tMean BOLD signal mask including non-brain tissue
-        tmean_mask = tmean_img > thr
+        thr = _percentile_inplace(np.extract(slab_mask, tmean_img), 98.0) * 0.1
 
         # Load probabilistic brain mask image
         bmask_nii = nib.load(self.inputs.bmask)
-        bmask_img = bmask_nii.get_fdata()
-        brain_mask = bmask_img > 0.5
+        bmask_img = bmask_nii.get_fdata(dtype=np.float32, caching='unchanged')
 
         # Construct melodic ICA brain signal mask from slab signal and brain mask
-        melmask_img = np.logical_and(tmean_mask, brain_mask).astype(np.uint8)
+        melmask_img = _melmask_kernel(tmean_img, bmask_img, thr)
 
         # Save melodic brain signal mask
         melmask_nii = nib.Nifti1Image(melmask_img, affine=tmean_nii.affine, header=tmean_nii.header)
@@ -82,4 +125,4 @@ class MelMask(BaseInterface):
 
     @staticmethod
     def _gen_outfile_name():
-        return Path(os.getcwd()) / 'melmask.nii.gz'
+        return Path(os.getcwd()) / 'melmask.nii'
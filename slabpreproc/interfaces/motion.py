@@ -9,7 +9,8 @@ DATES  : 2022-09-07 JMT Adapt from seepiref.py
 
 import os
 import numpy as np
-from scipy.signal import (filtfilt, butter)
+from functools import lru_cache
+from scipy.signal import (sosfiltfilt, butter)
 from pathlib import Path
 
 import pandas as pd
@@ -61,33 +62,31 @@ class Motion(BaseInterface):
     def _run_interface(self, runtime):
 
         # Load FSL motion correction timeseries
-        moco_df = pd.read_csv(
-            self.inputs.moco_pars,
-            names=["Rx_rad", "Ry_rad", "Rz_rad", "Dx_mm", "Dy_mm", "Dz_mm"],
-            sep=r"\s+"
-        )
-
-        fd_df = pd.read_csv(
-            self.inputs.fd_pars,
-            names=['FD_mm'],
-            header=0,
-            sep=r"\s+"
-        )
+        # Small whitespace-delimited numeric tables, so skip the pandas parser
+        moco = np.loadtxt(self.inputs.moco_pars, ndmin=2)
+        nt = moco.shape[0]
 
+        # Framewise displacement file has a single header line
         # Add initial zero for FD (Power 2012 FD definition uses backwards difference)
-        zero_df = pd.DataFrame({'FD_mm': [0]})
-        fd_df = pd.concat([zero_df, fd_df], ignore_index=True)
+        fd_mm = np.zeros(nt)
+        fd_mm[1:] = np.loadtxt(self.inputs.fd_pars, skiprows=1, ndmin=1)
 
-        # Merge data frames
-        motion_df = moco_df.merge(fd_df, left_index=True, right_index=True)
-
-        # Add time column
+        # Time column
         tr_s = self.inputs.bold_meta['RepetitionTime']
-        nt = len(moco_df.index)
-        motion_df.insert(0, 'Time_s', np.arange(0, nt).reshape(-1, 1) * tr_s)
-
-        # Low pass filter FD at 2 Hz
-        motion_df = self._lpf_fd(motion_df, tr_s)
+        time_s = np.arange(0, nt) * tr_s
+
+        # Assemble full motion table in one step
+        motion_df = pd.DataFrame({
+            'Time_s': time_s,
+            'Rx_rad': moco[:, 0],
+            'Ry_rad': moco[:, 1],
+            'Rz_rad': moco[:, 2],
+            'Dx_mm': moco[:, 3],
+            'Dy_mm': moco[:, 4],
+            'Dz_mm': moco[:, 5],
+            'FD_mm': fd_mm,
+            'lpf_FD_mm': self._lpf_fd(fd_mm, tr_s)
+        })
 
         # Save dataframe
         motion_df.to_csv(self._gen_outfile_name(), index=False, float_format="%0.6g")
@@ -104,27 +103,30 @@ class Motion(BaseInterface):
     def _gen_outfile_name(self):
         return Path(os.getcwd()) / 'motion.csv'
 
-    def _lpf_fd(self, df, tr_s):
+    def _lpf_fd(self, fd_mm, tr_s):
         """
         Low pass filter the raw FD
 
-        :param df: DataFrame
-            Raw motion parameters including FD in mm
-        :return: lpf_fd_df: DataFrame
-            Original dataframe with new lpf FD column
+        :param fd_mm: numpy array
+            Raw FD timeseries in mm
+        :param tr_s: float
+            TR in seconds
+        :return: lpf_fd_mm: numpy array
+            Low pass filtered FD timeseries in mm
         """
 
         # Create low pass Butterworth filter for this TR
-        b, a = self._butterworth_lpf(tr_s)
+        sos = self._butterworth_lpf(tr_s)
 
         # Apply forward-backward LPF to FD timeseries
-        df['lpf_FD_mm'] = filtfilt(b, a, df['FD_mm'].values, axis=0)
-
-        return df
+        return sosfiltfilt(sos, fd_mm, axis=0)
 
-    def _butterworth_lpf(self, tr_s=1.0, fc_hz=0.2, N=5):
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _butterworth_lpf(tr_s=1.0, fc_hz=0.2, N=5):
         """
-        Construct a 0.2 Hz low-pass Butterworth filter
+        Construct a 0.2 Hz low-pass Butterworth filter as second-order sections
+        Cached by TR since all runs in a session typically share the same design
 
         :param tr_s: float
             TR in seconds
@@ -132,13 +134,14 @@ class Motion(BaseInterface):
             Cutoff frequence in Hz
         :param N: int
             Butterworth filter order
-        :return:
+        :return: sos: numpy array
+            Second-order sections filter coefficients (treat as read-only)
         """
 
         # Sampling rate (Hz)
         fs_hz = 1.0 / tr_s
 
         # Design filter
-        b, a = butter(N, fc_hz, btype='low', analog=False, output='ba', fs=fs_hz)
+        sos = butter(N, fc_hz, btype='low', analog=False, output='sos', fs=fs_hz)
 
-        return b, a
+        return sos
@@ -13,6 +13,7 @@ import os
 from pathlib import Path
 
 import nibabel as nib
+import numpy as np
 from lapunwrap3d import LaplacianPhaseUnwrap3D
 from nipype.interfaces.base import (
     BaseInterface,
@@ -43,7 +44,7 @@ class LapUnwrap(BaseInterface):
     def _run_interface(self, runtime):
         # Load 3D or 3D x t wrapped phase image (radians)
         phi_w_nii = nib.load(self.inputs.phi_w)
-        phi_w = phi_w_nii.get_fdata()
+        phi_w = phi_w_nii.get_fdata(dtype=np.float32, caching='unchanged')
 
         # Laplacian phase unwrap spatial dimensions
         lapuw = LaplacianPhaseUnwrap3D(phi_w)
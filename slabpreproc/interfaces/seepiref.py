@@ -71,13 +71,14 @@ class SEEPIRef(BaseInterface):
         # Get SBRef PE direction
         sbref_pe_dir = self.inputs.sbref_meta['PhaseEncodingDirection']
 
-        # Loop over SE-EPI metadata extracting PE directions
-        for fc, seepi_mag_fname in enumerate(self.inputs.seepi_mag_list):
-
-            fmap_meta = self.inputs.seepi_meta_list[fc]
-            fmap_pe_dir = fmap_meta['PhaseEncodingDirection']
-
-            if fmap_pe_dir == sbref_pe_dir:
-                outputs["seepi_mag_ref"] = seepi_mag_fname
+        # Map SE-EPI PE directions to fieldmap filenames
+        # Later fieldmaps with the same PE direction take precedence
+        pe_to_seepi = {
+            fmap_meta['PhaseEncodingDirection']: seepi_mag_fname
+            for seepi_mag_fname, fmap_meta in zip(self.inputs.seepi_mag_list, self.inputs.seepi_meta_list)
+        }
+
+        if sbref_pe_dir in pe_to_seepi:
+            outputs["seepi_mag_ref"] = pe_to_seepi[sbref_pe_dir]
 
         return outputs
@@ -6,9 +6,14 @@ PLACE  : Caltech
 DATES  : 2022-08-22 JMT Adapt from topupencfile.py
 """
 
+import hashlib
+import json
+import os
 import os.path as op
+import re
+from functools import lru_cache
+from importlib import metadata
 
-import bids.layout
 from nipype.interfaces.base import (
     BaseInterface,
     BaseInterfaceInputSpec,
@@ -17,7 +22,18 @@ from nipype.interfaces.base import (
     traits
 )
 
-from ..utils import ReportPDF
+# ReportPDF file keys and the corresponding SummaryReport input names (same order)
+_SUMMARY_KEYS = (
+    'SourceBOLD', 'T1wHead', 'T2wHead', 'Labels', 'SEEPIRef', 'SBRef',
+    'tMean', 'tSFNR', 'Dropout', 'B0Hz', 'MotionTable',
+)
+_SUMMARY_ATTRS = (
+    'source_bold', 't1w_head', 't2w_head', 'labels', 'seepiref', 'sbref',
+    'tmean', 'tsfnr', 'dropout', 'topup_b0_hz', 'motion_csv',
+)
+
+# Subject and session labels from a BIDS basename
+_SUBJ_SESS_RE = re.compile(r'sub-(?P<subject>[a-zA-Z0-9]+)_ses-(?P<session>[a-zA-Z0-9]+)_')
 
 """
 Identify the SE-EPI fieldmap with the same PE direction as the BOLD series to be unwarped
@@ -35,7 +51,6 @@ class SummaryReportInputSpec(BaseInterfaceInputSpec):
 
     source_bold = File(
         desc='Source BOLD image (metadata reference)',
-        exists=True,
         mandatory=True
     )
 
@@ -47,64 +62,60 @@ class SummaryReportInputSpec(BaseInterfaceInputSpec):
 
     t1w_head = File(
         desc='Individual T1w template head',
-        exists=True,
         mandatory=True
     )
 
     t2w_head = File(
         desc='Individual T2w template head',
-        exists=True,
         mandatory=True
     )
 
     labels = File(
         desc='Template atlas labels',
-        exists=True,
         mandatory=True
     )
 
     seepiref = File(
         desc='SE-EPI reference image file',
-        exists=True,
         mandatory=True
     )
 
     sbref = File(
         desc='Single-band reference image file',
-        exists=True,
         mandatory=True
     )
 
     tmean = File(
         desc='Temporal mean BOLD image file',
-        exists=True,
         mandatory=True
     )
 
     tsfnr = File(
         desc='tSFNR image file',
-        exists=True,
         mandatory=True
     )
 
     dropout = File(
         desc='Estimated dropout image file',
-        exists=True,
         mandatory=True
     )
 
     topup_b0_hz = File(
         desc='TOPUP estimated B0 fieldmap in Hz',
-        exists=True,
         mandatory=True
     )
 
     motion_csv = File(
         desc='Motion parameter CSV table',
-        exists=True,
         mandatory=True
     )
 
+    skip_unchanged = traits.Bool(
+        False,
+        usedefault=True,
+        desc='Skip rendering if report inputs and slabpreproc version are unchanged since the last report'
+    )
+
 
 class SummaryReport(BaseInterface):
 
@@ -113,34 +124,132 @@ class SummaryReport(BaseInterface):
 
     def _run_interface(self, runtime):
 
+        # Deferred import - ReportPDF pulls in matplotlib and reportlab
+        from ..utils import ReportPDF
+
+        # Bind inputs once
+        ins = self.inputs
+
         # Construct dictionary of required files to pass to ReportPDF
-        report_files = {
-            'SourceBOLD': self.inputs.source_bold,
-            'T1wHead': self.inputs.t1w_head,
-            'T2wHead': self.inputs.t2w_head,
-            'Labels': self.inputs.labels,
-            'SEEPIRef': self.inputs.seepiref,
-            'SBRef': self.inputs.sbref,
-            'tMean': self.inputs.tmean,
-            'tSFNR': self.inputs.tsfnr,
-            'Dropout': self.inputs.dropout,
-            'B0Hz': self.inputs.topup_b0_hz,
-            'MotionTable': self.inputs.motion_csv,
-        }
+        report_files = dict(zip(_SUMMARY_KEYS, (getattr(ins, attr) for attr in _SUMMARY_ATTRS)))
+
+        # Check all report files exist in a single pass (File traits skip per-input checks)
+        missing = [fname for fname in report_files.values() if not op.isfile(fname)]
+        if missing:
+            raise FileNotFoundError(f'Missing summary report input files: {missing}')
+
+        report_dname = self._gen_report_dname()
+
+        if ins.skip_unchanged:
+
+            # Content key for this report (file paths, mtimes and sizes, metadata and renderer version)
+            # Computed before ReportPDF adds its own entries to the metadata dict
+            report_key = _report_key(report_files, ins.source_bold_meta)
+            key_fname = self._gen_key_fname(report_dname)
+
+            # Skip rendering if the previous report was built from identical inputs
+            if op.isfile(key_fname):
+                with open(key_fname, 'r') as fd:
+                    last_key, last_pdf = (fd.read().splitlines() + ['', ''])[:2]
+                if last_key == report_key and op.isfile(last_pdf):
+                    print(f'  Report inputs unchanged - keeping {last_pdf}')
+                    return runtime
 
         # Build summary report for the slabpreproc of the source BOLD image
-        ReportPDF(
-            self._gen_report_dname(),
+        report = ReportPDF(
+            report_dname,
             report_files,
-            self.inputs.source_bold_meta,
+            ins.source_bold_meta,
         )
 
+        # Record content key and report PDF for the next run
+        if ins.skip_unchanged:
+            with open(key_fname, 'w') as fd:
+                fd.write(f'{report_key}\n{report.report_pdf}\n')
+
         return runtime
 
-    def _gen_report_dname(self):
+    def _gen_key_fname(self, report_dname):
 
-        keys = bids.layout.parse_file_entities(self.inputs.source_bold)
+        # Hidden per-source sidecar in the report folder
+        source_stub = op.basename(self.inputs.source_bold).split('.nii')[0]
+
+        return op.join(report_dname, f'.{source_stub}_report.sha256')
+
+    def _gen_report_dname(self):
+        return _report_dname(self.inputs.deriv_dir, self.inputs.source_bold)
+
+
+def _report_key(report_files, bold_meta):
+    """
+    Content key for a summary report from its input files, metadata and renderer
+    Includes the slabpreproc version and the report rendering sources so that
+    code changes invalidate previously rendered reports
+
+    :param report_files: dict
+        Dictionary of paths to files used to generate report
+    :param bold_meta: dict
+        Source BOLD metadata
+    :return: str
+        SHA256 hex digest
+    """
+
+    # Stable serialization of paths, metadata and version (independent of dict order and process)
+    key = hashlib.sha256()
+    key.update(json.dumps(
+        {'files': report_files, 'meta': bold_meta, 'version': _package_version()},
+        sort_keys=True, default=str
+    ).encode())
+
+    for fname in list(report_files.values()) + _renderer_sources():
+        fstat = os.stat(fname)
+        key.update(f'{fstat.st_mtime_ns}:{fstat.st_size}'.encode())
+
+    return key.hexdigest()
+
+
+@lru_cache(maxsize=1)
+def _package_version():
+    """
+    Installed slabpreproc version (empty string if not installed as a package)
+    """
+    try:
+        return metadata.version('slabpreproc')
+    except metadata.PackageNotFoundError:
+        return ''
+
+
+def _renderer_sources():
+    """
+    Source files of the report renderer (ReportPDF and figure helpers)
+    """
+    utils_dname = op.join(op.dirname(op.dirname(op.abspath(__file__))), 'utils')
+    return [op.join(utils_dname, 'reportpdf.py'), op.join(utils_dname, 'graphics.py')]
+
+
+@lru_cache(maxsize=32)
+def _report_dname(deriv_dir, source_bold):
+    """
+    Report folder for a source BOLD image, memoized on its inputs
+
+    :param deriv_dir: str, pathlike
+        BIDS derivative directory for slabpreproc
+    :param source_bold: str, pathlike
+        Source BOLD image path
+    :return: str
+        Subject/session report folder path
+    """
+
+    # Fast path for standard BIDS basenames (sub-<label>_ses-<label>_...)
+    bids_match = _SUBJ_SESS_RE.match(op.basename(source_bold))
+
+    if bids_match:
+        subj_id, sess_id = bids_match['subject'], bids_match['session']
+    else:
+        # Deferred import - pybids is slow to import and only needed here
+        from bids.layout import parse_file_entities
+        keys = parse_file_entities(source_bold)
         subj_id = keys['subject']
         sess_id = keys['session']
 
-        return op.join(self.inputs.deriv_dir, f'sub-{subj_id}', f'ses-{sess_id}', 'report')
+    return op.join(deriv_dir, f'sub-{subj_id}', f'ses-{sess_id}', 'report')
@@ -8,26 +8,53 @@ DATES  : 2022-07-23 JMT From scratch
 """
 
 import os
-import numpy as np
-from pathlib import Path
+import os.path as op
 
 from nipype.interfaces.base import (
     BaseInterface,
     BaseInterfaceInputSpec,
     traits,
     File,
-    Undefined,
     InputMultiPath,
     InputMultiObject,
     TraitedSpec
 )
 
-from nipype.utils.filemanip import split_filename
-
 """
 Collect encoding directions and EPI total effective readout times from SE-EPI fieldmaps
 """
 
+# FSL TOPUP encoding vectors and row index for each BIDS phase encoding direction
+_ENC_DIRS = (
+    (1, 0, 0),
+    (-1, 0, 0),
+    (0, 1, 0),
+    (0, -1, 0),
+    (0, 0, 1),
+    (0, 0, -1),
+)
+
+_PE_INDEX = {'i': 0, 'i-': 1, 'j': 2, 'j-': 3, 'k': 4, 'k-': 5}
+
+
+def _pe_index(bids_pe_dir):
+    """
+    Encoding vector row index for a BIDS PE direction (i, j, k == x, y, z)
+
+    :param bids_pe_dir: str
+        BIDS PhaseEncodingDirection
+    :return: int
+        Row index into _ENC_DIRS. Defaults to +y for unknown directions
+    """
+
+    pe_idx = _PE_INDEX.get(bids_pe_dir)
+
+    if pe_idx is None:
+        print(f'* Unknown PE direction {bids_pe_dir}')
+        pe_idx = _PE_INDEX['j']
+
+    return pe_idx
+
 
 class TOPUPEncFileInputSpec(BaseInterfaceInputSpec):
 
@@ -59,48 +86,26 @@ class TOPUPEncFile(BaseInterface):
 
     def _run_interface(self, runtime):
 
-        # Init encoding matrix
-        enc_mat = []
-
-        # Get readout time and phase encoding directions from fmap metadata
-        for ec, epi_fname in enumerate(self.inputs.epi_list):
-
-            epi_meta = self.inputs.meta_list[ec]
-            t_ro = epi_meta['TotalReadoutTime']
-
-            # Convert BIDS PE direction (i, j, k) to FSL direction (x, y, z)
-            bids_pe_dir = epi_meta['PhaseEncodingDirection']
-            fsl_pe_dir = bids_pe_dir.replace('i', 'x').replace('j', 'y').replace('k', 'z')
-
-            if fsl_pe_dir == 'x':
-                v_enc = [1, 0, 0, t_ro]
-            elif fsl_pe_dir == 'x-':
-                v_enc = [-1, 0, 0, t_ro]
-            elif fsl_pe_dir == 'y':
-                v_enc = [0, 1, 0, t_ro]
-            elif fsl_pe_dir == 'y-':
-                v_enc = [0, -1, 0, t_ro]
-            elif fsl_pe_dir == 'z':
-                v_enc = [0, 0, 1, t_ro]
-            elif fsl_pe_dir == 'z-':
-                v_enc = [0, 0, -1, t_ro]
-            else:
-                print(f'* Unknown PE direction {fsl_pe_dir}')
-                v_enc = [0, 1, 0, t_ro]
-
-            # Add encoding row to encoding matrix
-            enc_mat.append(v_enc)
+        ins = self.inputs
 
         # Store the encoding file in the runtime current working directory
-        encoding_file = self._gen_encfile_name()
-        np.savetxt(fname=str(encoding_file), X=enc_mat, fmt="%2d %2d %2d %9.6f")
+        # Remember the path for _list_outputs
+        encoding_file = self._encfile = self._gen_encfile_name()
+
+        # Stream one encoding row per EPI from the fmap metadata
+        # PE direction vector followed by total readout time
+        with open(encoding_file, 'w') as fd:
+            for _, epi_meta in zip(ins.epi_list, ins.meta_list):
+                x, y, z = _ENC_DIRS[_pe_index(epi_meta['PhaseEncodingDirection'])]
+                t_ro = epi_meta['TotalReadoutTime']
+                fd.write(f'{x:2d} {y:2d} {z:2d} {t_ro:9.6f}\n')
 
         return runtime
 
     def _list_outputs(self):
         outputs = self._outputs().get()
-        outputs["encoding_file"] = self._gen_encfile_name()
+        outputs["encoding_file"] = getattr(self, '_encfile', None) or self._gen_encfile_name()
         return outputs
 
     def _gen_encfile_name(self):
-        return Path(os.getcwd()) / 'topup_encoding_file.txt'
\ No newline at end of file
+        return op.join(os.getcwd(), 'topup_encoding_file.txt')
\ No newline at end of file
@@ -29,13 +29,201 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import os
+import os.path as op
+from functools import lru_cache
+
 import numpy as np
 import matplotlib.pyplot as plt
 import nibabel as nib
 
-from scipy.signal import periodogram
-from skimage.util import montage
-from skimage.exposure import rescale_intensity
+
+def _savefig(fname, dpi=300):
+    """
+    Save the current figure with a fast PNG encoder setting
+    Non-PNG filenames (eg .pdf, .svg) are saved as vector graphics by extension
+
+    :param fname: str, pathlike
+        Output figure filename
+    :param dpi: int
+        Raster resolution in dots per inch
+    :return:
+    """
+
+    if str(fname).lower().endswith('.png'):
+        # zlib level 3 encodes several times faster than the default with similar file size
+        plt.savefig(fname, dpi=dpi, pil_kwargs={'compress_level': 3})
+    else:
+        plt.savefig(fname, dpi=dpi)
+
+
+def _power_spectrum(x, fs):
+    """
+    One-sided power spectrum of a real timeseries
+    Matches scipy.signal.periodogram(x, fs, scaling='spectrum') with the default
+    boxcar window and constant detrend, without the wrapper overhead
+
+    :param x: numpy array
+        1D real timeseries
+    :param fs: float
+        Sampling frequency (Hz)
+    :return: tuple of numpy arrays
+        Frequencies (Hz) and power spectrum (units of x squared)
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    n = x.size
+
+    # Constant detrend then real FFT
+    X = np.fft.rfft(x - x.mean())
+    pspec = (X.real * X.real + X.imag * X.imag) / float(n * n)
+
+    # Fold negative frequencies into one-sided spectrum (DC and even-N Nyquist bins appear once)
+    if n % 2:
+        pspec[1:] *= 2.0
+    else:
+        pspec[1:-1] *= 2.0
+
+    f = np.fft.rfftfreq(n, d=1.0 / fs)
+
+    return f, pspec
+
+
+def _rescale_unit(m2d, lo=None, hi=None):
+    """
+    Linearly rescale an image to [0, 1] in float32, clipping outside [lo, hi]
+    Replaces skimage rescale_intensity(..., out_range=(0, 1)) without the float64 round-trip
+
+    :param m2d: numpy array
+        Image to rescale
+    :param lo: float
+        Lower input intensity (defaults to image minimum)
+    :param hi: float
+        Upper input intensity (defaults to image maximum)
+    :return: numpy array
+        Rescaled float32 image
+    """
+
+    if lo is None:
+        lo = m2d.min()
+    if hi is None:
+        hi = m2d.max()
+
+    scale = np.float32(1.0 / max(float(hi) - float(lo), 1e-12))
+
+    # Single temporary for the offset, then scale and clip in place
+    out = np.subtract(m2d, np.float32(lo), dtype=np.float32)
+    out *= scale
+    np.clip(out, 0.0, 1.0, out=out)
+
+    return out
+
+
+def _even_indices(nn, k):
+    """
+    Integer indices of k evenly spaced samples over range(nn)
+    Equivalent to np.linspace(0, nn - 1, k).astype(int) with an integer-step fast path
+
+    :param nn: int
+        Length of sampled axis
+    :param k: int
+        Number of samples
+    :return: numpy array
+        Integer sample indices
+    """
+
+    if k > 1 and nn > 1 and (nn - 1) % (k - 1) == 0:
+        return np.arange(0, nn, (nn - 1) // (k - 1), dtype=np.intp)
+
+    return np.linspace(0, nn - 1, k).astype(np.intp)
+
+
+def _fit_to_raster(m2d, tgt_w, average=True):
+    """
+    Downsample a 2D image to at most twice the target raster width
+    Saves Agg from resampling very large montages at draw time
+
+    :param m2d: numpy array
+        2D image
+    :param tgt_w: int
+        Target output width in pixels
+    :param average: bool
+        Block-average continuous images. Use False for label or zero-transparent
+        overlays, which are stride subsampled to keep original values and edges
+    :return: numpy array
+        Downsampled 2D image (or the input if already small enough)
+    """
+
+    factor = m2d.shape[1] // (2 * tgt_w)
+
+    if factor < 2:
+        return m2d
+
+    # Trim to whole blocks so both modes give the same output shape
+    ny, nx = (m2d.shape[0] // factor) * factor, (m2d.shape[1] // factor) * factor
+
+    if not average:
+        return m2d[:ny:factor, :nx:factor]
+
+    # Average over factor x factor blocks
+    blocks = m2d[:ny, :nx].reshape(ny // factor, factor, nx // factor, factor)
+
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+
+def _fast_pctile(a, ps):
+    """
+    Percentiles by quickselect with linear interpolation
+    Matches np.percentile default results with a single partition pass
+
+    :param a: numpy array
+        Image array of any shape
+    :param ps: tuple
+        Percentiles in range [0, 100]
+    :return: numpy array
+        Percentile values, one per entry in ps
+    """
+
+    flat = np.ravel(a)
+    n = flat.size
+
+    # Fractional ranks and bracketing order statistics
+    h = np.asarray(ps, dtype=np.float64) / 100.0 * (n - 1)
+    lo = np.floor(h).astype(np.intp)
+    hi = np.minimum(lo + 1, n - 1)
+
+    part = np.partition(flat, np.unique(np.concatenate([lo, hi])))
+
+    return part[lo] + (h - lo) * (part[hi] - part[lo])
+
+
+def _montage(stack, grid_shape):
+    """
+    Tile a stack of 2D images into a single 2D montage, row by row
+    Partial grids are padded with the stack mean, then the full grid is
+    assembled by a pure reshape-transpose with one contiguous copy
+
+    :param stack: numpy array
+        Image stack (n, h, w)
+    :param grid_shape: tuple
+        Montage grid (rows, cols)
+    :return: numpy array
+        2D montage image (rows * h, cols * w)
+    """
+
+    n_rows, n_cols = grid_shape
+    n, h, w = stack.shape
+    n_tiles = n_rows * n_cols
+
+    if n > n_tiles:
+        raise ValueError(f'{n} images do not fit a {n_rows} x {n_cols} montage')
+
+    # Pad empty tiles with the mean over all images
+    if n < n_tiles:
+        fill = np.full((n_tiles - n, h, w), stack.mean(), dtype=stack.dtype)
+        stack = np.concatenate([stack, fill])
+
+    return stack.reshape(n_rows, n_cols, h, w).transpose(0, 2, 1, 3).reshape(n_rows * h, n_cols * w)
 
 
 def plot_motion_timeseries(motion_df, plot_fname, figsize=(7, 5)):
@@ -55,7 +243,8 @@ def plot_motion_timeseries(motion_df, plot_fname, figsize=(7, 5)):
     # Upscale factor to keep labels small
     up_sf = 1.5
 
-    fig, axs = plt.subplots(3, 1, figsize=tuple(np.array(figsize) * up_sf))
+    # Constrained layout spaces subplots without title overlap
+    fig, axs = plt.subplots(3, 1, figsize=tuple(np.array(figsize) * up_sf), constrained_layout=True)
 
     # Plot axis displacements in mm
     motion_df.plot(
@@ -90,11 +279,8 @@ def plot_motion_timeseries(motion_df, plot_fname, figsize=(7, 5)):
     axs[2].grid(color='gray', linestyle=':', linewidth=1)
     axs[2].set_xlabel('Time (s)')
 
-    # Space subplots without title overlap
-    plt.tight_layout()
-
     # Save plot to file
-    plt.savefig(plot_fname, dpi=300)
+    _savefig(plot_fname)
 
     # Close plot
     plt.close()
@@ -116,7 +302,8 @@ def plot_motion_powerspec(motion_df, plot_fname, figsize=(7.0, 3.0)):
     # Upscale factor to keep labels small
     up_sf = 1.5
 
-    fig, axs = plt.subplots(1, 1, figsize=tuple(np.array(figsize) * up_sf))
+    # Constrained layout spaces subplots without title overlap
+    fig, axs = plt.subplots(1, 1, figsize=tuple(np.array(figsize) * up_sf), constrained_layout=True)
 
     # Extract vectors from dataframe
     t = motion_df['Time_s'].values
@@ -125,10 +312,10 @@ def plot_motion_powerspec(motion_df, plot_fname, figsize=(7.0, 3.0)):
     fs = 1.0 / (t[1] - t[0])
 
     # Framewise displacement timeseries
-    fd = motion_df['FD_mm']
+    fd = motion_df['FD_mm'].to_numpy()
 
     # Power spectra framewise displacement
-    f, pspec = periodogram(fd, fs, scaling='spectrum')
+    f, pspec = _power_spectrum(fd, fs)
 
     # Drop first point (zero)
     f = f[1:]
@@ -139,11 +326,8 @@ def plot_motion_powerspec(motion_df, plot_fname, figsize=(7.0, 3.0)):
     axs.grid(color='gray', linestyle=':', linewidth=1)
     axs.set_xlabel('Frequency (Hz)')
 
-    # Space subplots without title overlap
-    plt.tight_layout()
-
     # Save plot to file
-    plt.savefig(plot_fname, dpi=300)
+    _savefig(plot_fname)
 
     # Close plot
     plt.close()
@@ -159,13 +343,16 @@ def orthoslices(img_nii, ortho_fname, cmap='viridis', irng='default'):
     :return:
     """
 
-    img3d = img_nii.get_data()
+    img3d = img_nii.get_fdata(dtype=np.float32, caching='unchanged')
+
+    # Look up colormap once for all panels
+    cm = plt.get_cmap(cmap)
 
     # Intensity scaling
     if 'robust' in irng:
-        vmin, vmax = np.percentile(img3d, (1, 99))
+        vmin, vmax = _fast_pctile(img3d, (1, 99))
     elif 'noscale' in irng:
-        nc = plt.get_cmap(cmap).N
+        nc = cm.N
         vmin, vmax = 0, nc
     else:
         vmin, vmax = np.min(img3d), np.max(img3d)
@@ -177,14 +364,15 @@ def orthoslices(img_nii, ortho_fname, cmap='viridis', irng='default'):
 
     # Extract central section for each orientation
     # Assumes RAS orientation
-    m_sag = img3d[hx, :, :].transpose()
-    m_cor = img3d[:, hy, :].transpose()
-    m_tra = img3d[:, :, hz].transpose()
+    # Contiguous copies so imshow resampling reads unit-stride rows
+    m_sag = np.ascontiguousarray(img3d[hx, :, :].T)
+    m_cor = np.ascontiguousarray(img3d[:, hy, :].T)
+    m_tra = np.ascontiguousarray(img3d[:, :, hz].T)
 
     # Use transverse image for colorbar reference
     trafig = axs[0].imshow(
         m_tra,
-        cmap=plt.get_cmap(cmap),
+        cmap=cm,
         vmin=vmin, vmax=vmax,
         aspect='equal',
         origin='lower'
@@ -194,7 +382,7 @@ def orthoslices(img_nii, ortho_fname, cmap='viridis', irng='default'):
 
     axs[1].imshow(
         m_cor,
-        cmap=plt.get_cmap(cmap),
+        cmap=cm,
         vmin=vmin, vmax=vmax,
         aspect='equal',
         origin='lower'
@@ -204,7 +392,7 @@ def orthoslices(img_nii, ortho_fname, cmap='viridis', irng='default'):
 
     axs[2].imshow(
         m_sag,
-        cmap=plt.get_cmap(cmap),
+        cmap=cm,
         vmin=vmin, vmax=vmax,
         aspect='equal',
         origin='lower'
@@ -215,7 +403,7 @@ def orthoslices(img_nii, ortho_fname, cmap='viridis', irng='default'):
     plt.colorbar(trafig, ax=axs, location='right', shrink=0.75)
 
     # Save plot to file
-    plt.savefig(ortho_fname, dpi=300)
+    _savefig(ortho_fname)
 
     # Close plot
     plt.close()
@@ -235,9 +423,14 @@ def orthoslice_montage(img_nii, montage_fname, cmap='viridis', irng='default'):
 
     orient_name = ['Axial', 'Coronal', 'Sagittal']
 
-    img3d = img_nii.get_data()
+    img3d = img_nii.get_fdata(dtype=np.float32, caching='unchanged')
+
+    # Look up colormap once for all panels
+    cm = plt.get_cmap(cmap)
 
-    plt.subplots(1, 3, figsize=(7, 2.4))
+    # Constrained layout with no padding between panels
+    fig, axs = plt.subplots(1, 3, figsize=(7, 2.4), constrained_layout=True)
+    fig.get_layout_engine().set(w_pad=0, h_pad=0)
 
     for ax in [0, 1, 2]:
 
@@ -247,38 +440,35 @@ def orthoslice_montage(img_nii, montage_fname, cmap='viridis', irng='default'):
 
         # Downsample to 9 images in first dimension
         nx = s.shape[0]
-        xx = np.linspace(0, nx - 1, 9).astype(int)
+        xx = _even_indices(nx, 9)
         s = s[xx, :, :]
 
         # Construct 3x3 montage of slices
-        m2d = montage(s, fill='mean', grid_shape=(3, 3))
+        m2d = _montage(s, grid_shape=(3, 3))
 
         # Intensity scaling
         if 'default' in irng:
-            m2d = rescale_intensity(m2d, in_range='image', out_range=(0, 1))
+            m2d = _rescale_unit(m2d)
         elif 'robust' in irng:
-            pmin, pmax = np.percentile(m2d, (1, 99))
-            m2d = rescale_intensity(m2d, in_range=(pmin, pmax), out_range=(0, 1))
+            pmin, pmax = _fast_pctile(m2d, (1, 99))
+            m2d = _rescale_unit(m2d, pmin, pmax)
         else:
             # Do nothing
             pass
 
-        plt.subplot(1, 3, ax + 1)
-        plt.imshow(
+        # Pre-size to roughly the panel raster width (7 inch figure at 300 dpi over three panels)
+        m2d = _fit_to_raster(m2d, 7 * 300 // 3)
+
+        axs[ax].imshow(
             m2d,
-            cmap=plt.get_cmap(cmap),
+            cmap=cm,
             aspect='equal'
         )
-        plt.title(orient_name[ax])
-
-        plt.axis('off')
-        plt.subplots_adjust(bottom=0.0, top=0.9, left=0.0, right=1.0)
-
-    # Remove excess space
-    plt.tight_layout()
+        axs[ax].set_title(orient_name[ax])
+        axs[ax].set_axis_off()
 
     # Save plot to file
-    plt.savefig(montage_fname, dpi=300)
+    _savefig(montage_fname)
 
     # Close plot
     plt.close()
@@ -298,8 +488,8 @@ def image_montage(img3d, under3d, montage_fname, dims=(4, 6), cmap_name='magma',
         Montage dimensions (rows, columns)
     :param cmap_name: str
         Colormap name (see matplotlib docs) to use for overlay image
-    :param scaling: str or tuple
-        Intensity range to use for montage. See skimage.exposure.rescale_intensity
+    :param scaling: str
+        Intensity range to use for montage ('default' for full range or 'robust' for 10-98th percentiles)
     :param axis:
         Axis perpendicular to montage subimage plane
     :return hw_ratio: float
@@ -309,44 +499,41 @@ def image_montage(img3d, under3d, montage_fname, dims=(4, 6), cmap_name='magma',
     # Montage dimensions
     n_rows, n_cols = dims
 
-    # If not underlay image provided, set to zeros
-    if len(under3d) < 1:
-        underlay = False
-        under3d = np.zeros_like(img3d)
-    else:
-        underlay = True
+    # Underlay only drawn if an image is provided
+    underlay = len(under3d) > 0
 
     # Downsample to 4x6 = 24 images in specified axis
     nn = img3d.shape[axis]
-    inds = np.linspace(0, nn - 1, n_rows * n_cols).astype(int)
-
-    # Downsample and reorder axis to place downsampled axis first
-    if axis == 0:
-        img3d_dwn = img3d[inds, ...]
-        under3d_dwn = under3d[inds, ...]
-    elif axis == 1:
-        img3d_dwn = img3d[:, inds, :].transpose([1, 0, 2])
-        under3d_dwn = under3d[:, inds, :].transpose([1, 0, 2])
-    else:
-        img3d_dwn = img3d[..., inds].transpose([2, 1, 0])
-        img3d_dwn = np.flip(img3d_dwn, axis=1)
-        under3d_dwn = under3d[..., inds].transpose([2, 1, 0])
-        under3d_dwn = np.flip(under3d_dwn, axis=1)
+    inds = _even_indices(nn, n_rows * n_cols)
+
+    def _downsample(vol):
+        # Downsample and reorder axis to place downsampled axis first
+        if axis == 0:
+            vol_dwn = vol[inds, ...]
+        elif axis == 1:
+            vol_dwn = vol[:, inds, :].transpose([1, 0, 2])
+        else:
+            # Negative-stride view flips rows without a copy
+            vol_dwn = vol[..., inds].transpose([2, 1, 0])[:, ::-1, :]
+        return vol_dwn
 
-    # Construct 3x3 montage of slices
-    img_mont = montage(img3d_dwn, fill='mean', grid_shape=(n_rows, n_cols))
-    under_mont = montage(under3d_dwn, fill='mean', grid_shape=(n_rows, n_cols))
+    # Construct montage of slices
+    img_mont = _montage(_downsample(img3d), grid_shape=(n_rows, n_cols))
 
     # Intensity scaling of foreground image
     if 'robust' in scaling:
-        img_vmin, img_vmax = np.percentile(img_mont, (10, 98))
+        img_vmin, img_vmax = _fast_pctile(img_mont, (10, 98))
     else:
         img_vmin, img_vmax = img_mont.min(), img_mont.max()
 
     # Calculate aspect ratio (w/h) for figure generation
     hw_ratio = img_mont.shape[0] / img_mont.shape[1]
 
-    fig, axs = plt.subplots(1, 1, figsize=(12, 12 * hw_ratio))
+    # Pre-size montages to roughly the output raster width (12 inch figure at 300 dpi)
+    # Overlay may be a label image with zero set transparent, so subsample rather than average
+    img_mont = _fit_to_raster(img_mont, 12 * 300, average=False)
+
+    fig, axs = plt.subplots(1, 1, figsize=(12, 12 * hw_ratio), constrained_layout=True)
 
     # Initialize overlay colormap
     over_cmap = plt.get_cmap(cmap_name)
@@ -355,6 +542,9 @@ def image_montage(img3d, under3d, montage_fname, dims=(4, 6), cmap_name='magma',
     # Plot underlay first if required
     if underlay:
 
+        under_mont = _montage(_downsample(under3d), grid_shape=(n_rows, n_cols))
+        under_mont = _fit_to_raster(under_mont, 12 * 300)
+
         under_plot = axs.imshow(
             under_mont,
             cmap=plt.get_cmap('gray'),
@@ -378,10 +568,9 @@ def image_montage(img3d, under3d, montage_fname, dims=(4, 6), cmap_name='magma',
 
     # Tidy up axes
     plt.axis('off')
-    plt.tight_layout()
 
     # Save plot to file
-    plt.savefig(montage_fname, dpi=300)
+    _savefig(montage_fname)
 
     # Close plot
     plt.close()
@@ -393,19 +582,31 @@ def crop_to_slab(img_fname):
     """
     Crop volume to presumptive slab embedded within larger volume
     Project signal intensity onto axis 2, threshold and find bounding box, then crop
+    Results are cached per file path and modification time
 
-    :param a: numpy array
+    :param img_fname: str, pathlike
         3D image of slab embedded in a larger zero-filled volume
-    :return a_crop: numpy array
-        3D image containing slab signal
+    :return: tuple
+        Slab limits (start, stop) along axis 2
     """
 
+    img_fname = op.realpath(img_fname)
+
+    return _crop_to_slab(img_fname, os.stat(img_fname).st_mtime_ns)
+
+
+@lru_cache(maxsize=32)
+def _crop_to_slab(img_fname, mtime_ns):
+
     img_nii = nib.load(img_fname)
-    img = img_nii.get_fdata()
+    img = img_nii.get_fdata(dtype=np.float32, caching='unchanged')
 
-    proj = np.mean(np.mean(img, axis=1), axis=0)
+    # Single pass projection onto axis 2
+    proj = img.mean(axis=(0, 1), dtype=np.float32)
     proj_mask = proj > (np.max(proj) * 0.5)
-    in_mask = np.argwhere(proj_mask)
 
-    return in_mask.min(), in_mask.max() + 1
+    # First and last slab slices from the 1D mask without building an index array
+    z_min = np.argmax(proj_mask)
+    z_max = len(proj_mask) - np.argmax(proj_mask[::-1])
 
+    return int(z_min), int(z_max)
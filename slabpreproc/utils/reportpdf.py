@@ -44,6 +44,7 @@ import os.path as op
 
 import bids
 import nibabel as nib
+import numpy as np
 import pandas as pd
 from reportlab.lib.enums import TA_JUSTIFY
 from reportlab.lib.pagesizes import letter
@@ -116,6 +117,13 @@ class ReportPDF:
         self._add_image_montages()
         self._doc.build(self._contents)
 
+    @property
+    def report_pdf(self):
+        """
+        Path to the generated report PDF
+        """
+        return self._report_pdf_fname
+
     def _init_pdf(self):
 
         # Create a new PDF document
@@ -288,12 +296,12 @@ class ReportPDF:
         """
 
         # Load entire image and crop to slab
-        src_img = nib.load(self._report_files[img_name]).get_fdata()
+        src_img = nib.load(self._report_files[img_name]).get_fdata(dtype=np.float32, caching='unchanged')
         slab_img = src_img[:, :, zlims[0]:zlims[1]]
 
         # Optional underlay image
         if under_name:
-            under_img = nib.load(self._report_files[under_name]).get_fdata()
+            under_img = nib.load(self._report_files[under_name]).get_fdata(dtype=np.float32, caching='unchanged')
             under_img = under_img[:, :, zlims[0]:zlims[1]]
         else:
             under_img = []
@@ -11,6 +11,55 @@ import nipype.pipeline.engine as pe
 from ..interfaces.derivatives import DerivativesSorter
 
 
+# Derivatives file schema in sort order
+# (inputnode field, DataType, NewSuffix, FileType)
+_FILE_SCHEMA = (
+    ('tpl_bold_mag_preproc', 'preproc', 'recon-preproc_part-mag_bold', 'Image'),
+    ('tpl_bold_phs_preproc', 'preproc', 'recon-preproc_part-phase_bold', 'Image'),
+    ('tpl_bold_dphi_preproc', 'preproc', 'recon-preproc_part-phasediff_bold', 'Image'),
+    ('tpl_seepiref_preproc', 'preproc', 'recon-preproc_part-mag_seepi', 'Image'),
+    ('tpl_sbref_preproc', 'preproc', 'recon-preproc_part-mag_sbref', 'Image'),
+    ('tpl_bold_mag_tmean', 'qc', 'recon-tmean_part-mag_bold', 'Image'),
+    ('tpl_bold_mag_tsd', 'qc', 'recon-tsd_part-mag_bold', 'Image'),
+    ('tpl_bold_mag_tsfnr', 'qc', 'recon-tsfnr_part-mag_bold', 'Image'),
+    ('tpl_bold_mag_detrended', 'qc', 'recon-tsfnr_part-mag_detrended', 'Image'),
+    ('tpl_bold_mag_tsfnr_roistats', 'qc', 'recon-tsfnr_part-mag_bold_roistats', 'Text'),
+    ('tpl_topup_b0_hz', 'qc', 'recon-topup_fieldmap', 'Image'),
+    ('tpl_dropout', 'qc', 'recon-topup_dropout', 'Image'),
+    ('motion_csv', 'qc', 'recon-motion_pars', 'CSV'),
+    ('tpl_t1w_head', 'atlas', '', 'Image'),
+    ('tpl_t2w_head', 'atlas', '', 'Image'),
+    ('tpl_t1w_brain', 'atlas', '', 'Image'),
+    ('tpl_t2w_brain', 'atlas', '', 'Image'),
+    ('tpl_pseg', 'atlas', '', 'Image'),
+    ('tpl_dseg', 'atlas', '', 'Image'),
+    ('tpl_bmask', 'atlas', '', 'Image'),
+)
+
+# Derivatives folder schema - folders need separate Traits handling
+_FOLDER_SCHEMA = (
+    ('melodic_out_dir', 'melodic', 'melodic.ica', 'Folder'),
+)
+
+
+def _sort_dicts(schema):
+    """
+    Build DerivativesSorter sorting dictionaries from a derivatives schema
+
+    :param schema: tuple
+        (inputnode field, DataType, NewSuffix, FileType) tuples
+    :return: list of dicts
+        Sorting info dictionaries in schema order
+    """
+    return [{'DataType': dt, 'NewSuffix': suffix, 'FileType': ft} for _, dt, suffix, ft in schema]
+
+
+# Static sorting dictionaries built once at import
+# Shared by every derivatives_wf - DerivativesSorter treats them as read-only
+_FILE_SORT_DICTS = tuple(_sort_dicts(_FILE_SCHEMA))
+_FOLDER_SORT_DICTS = tuple(_sort_dicts(_FOLDER_SCHEMA))
+
+
 def build_derivatives_wf(deriv_dir):
     """
     :param deriv_dir: Path object
@@ -21,124 +70,55 @@ def build_derivatives_wf(deriv_dir):
     derivatives_wf = pe.Workflow(name='derivatives_wf')
 
     # Workflow input node
+    # Fields derived from the derivatives schema (file fields in sort order, then folders)
     inputnode = pe.Node(
         util.IdentityInterface(
-            fields=[
-                'source_file',
-                'tpl_bold_mag_preproc',
-                'tpl_bold_phs_preproc',
-                'tpl_bold_dphi_preproc',
-                'tpl_seepiref_preproc',
-                'tpl_sbref_preproc',
-                'tpl_bold_mag_tmean',
-                'tpl_bold_mag_tsd',
-                'tpl_bold_mag_tsfnr',
-                'tpl_bold_mag_detrended',
-                'tpl_bold_mag_tsfnr_roistats',
-                'tpl_topup_b0_hz',
-                'tpl_dropout',
-                'motion_csv',
-                'tpl_t1w_head',
-                'tpl_t2w_head',
-                'tpl_t1w_brain',
-                'tpl_t2w_brain',
-                'tpl_pseg',
-                'tpl_dseg',
-                'tpl_bmask',
-                'melodic_out_dir'  # Folder - separate handling
-            ]
+            fields=['source_file'] + [s[0] for s in _FILE_SCHEMA] + [s[0] for s in _FOLDER_SCHEMA]
         ),
         name='inputnode'
     )
 
-    # File sorting dictionary list
-    file_sort_dicts = [
-        {'DataType': 'preproc', 'NewSuffix': 'recon-preproc_part-mag_bold', 'FileType': 'Image'},
-        {'DataType': 'preproc', 'NewSuffix': 'recon-preproc_part-phase_bold', 'FileType': 'Image'},
-        {'DataType': 'preproc', 'NewSuffix': 'recon-preproc_part-phasediff_bold', 'FileType': 'Image'},
-        {'DataType': 'preproc', 'NewSuffix': 'recon-preproc_part-mag_seepi', 'FileType': 'Image'},
-        {'DataType': 'preproc', 'NewSuffix': 'recon-preproc_part-mag_sbref', 'FileType': 'Image'},
-        {'DataType': 'qc', 'NewSuffix': 'recon-tmean_part-mag_bold', 'FileType': 'Image'},
-        {'DataType': 'qc', 'NewSuffix': 'recon-tsd_part-mag_bold', 'FileType': 'Image'},
-        {'DataType': 'qc', 'NewSuffix': 'recon-tsfnr_part-mag_bold', 'FileType': 'Image'},
-        {'DataType': 'qc', 'NewSuffix': 'recon-tsfnr_part-mag_detrended', 'FileType': 'Image'},
-        {'DataType': 'qc', 'NewSuffix': 'recon-tsfnr_part-mag_bold_roistats', 'FileType': 'Text'},
-        {'DataType': 'qc', 'NewSuffix': 'recon-topup_fieldmap', 'FileType': 'Image'},
-        {'DataType': 'qc', 'NewSuffix': 'recon-topup_dropout', 'FileType': 'Image'},
-        {'DataType': 'qc', 'NewSuffix': 'recon-motion_pars', 'FileType': 'CSV'},
-        {'DataType': 'atlas', 'NewSuffix': '', 'FileType': 'Image'},
-        {'DataType': 'atlas', 'NewSuffix': '', 'FileType': 'Image'},
-        {'DataType': 'atlas', 'NewSuffix': '', 'FileType': 'Image'},
-        {'DataType': 'atlas', 'NewSuffix': '', 'FileType': 'Image'},
-        {'DataType': 'atlas', 'NewSuffix': '', 'FileType': 'Image'},
-        {'DataType': 'atlas', 'NewSuffix': '', 'FileType': 'Image'},
-        {'DataType': 'atlas', 'NewSuffix': '', 'FileType': 'Image'},
-    ]
-
-    # Folder sorting dictionary list - needs separate Traits handling
-    folder_sort_dicts = [
-        {'DataType': 'melodic', 'NewSuffix': 'melodic.ica', 'FileType': 'Folder'}
-    ]
-
-    # Create a list of all file inputnode
-    deriv_file_list = pe.Node(
-        util.Merge(numinputs=len(file_sort_dicts)),
-        name='deriv_file_list'
-    )
-
     # Create a list of all folder inputnode
+    # Trivial list join - run in the main process without a worker round-trip
     deriv_folder_list = pe.Node(
-        util.Merge(numinputs=len(folder_sort_dicts)),
-        name='deriv_folder_list'
+        util.Merge(numinputs=len(_FOLDER_SORT_DICTS)),
+        name='deriv_folder_list',
+        run_without_submitting=True
     )
 
     # Build multi-input derivatives output sorter
     # Renames and sorts inputnode into correct derivatives hierarchy
+    # Files connect directly to in1..inN, one per file sort dict
+    # Copies are I/O bound and overlap on a small thread pool inside the node,
+    # so the node only needs a single MultiProc processor slot
     deriv_sorter = pe.Node(
         DerivativesSorter(
+            numinputs=len(_FILE_SORT_DICTS),
             deriv_dir=deriv_dir,
-            file_sort_dicts=file_sort_dicts,
-            folder_sort_dicts=folder_sort_dicts
+            file_sort_dicts=list(_FILE_SORT_DICTS),
+            folder_sort_dicts=list(_FOLDER_SORT_DICTS),
+            num_threads=4
         ),
-        name='deriv_sorter'
+        name='deriv_sorter',
+        n_procs=1,
+        mem_gb=0.5
     )
 
+    # Sorter and Merge input edges in schema order (inN matches the Nth sort dict)
+    file_edges = [(s[0], f'in{i}') for i, s in enumerate(_FILE_SCHEMA, start=1)]
+    folder_edges = [(s[0], f'in{i}') for i, s in enumerate(_FOLDER_SCHEMA, start=1)]
+
     # Connect workflow
     derivatives_wf.connect([
 
         # Pass source BOLD filename to derivatives sorter as a filename template
         (inputnode, deriv_sorter, [('source_file', 'source_file')]),
 
-        # Create file list and pass to sorter
-        (inputnode, deriv_file_list, [
-            ('tpl_bold_mag_preproc', 'in1'),
-            ('tpl_bold_phs_preproc', 'in2'),
-            ('tpl_bold_dphi_preproc', 'in3'),
-            ('tpl_seepiref_preproc', 'in4'),
-            ('tpl_sbref_preproc', 'in5'),
-            ('tpl_bold_mag_tmean', 'in6'),
-            ('tpl_bold_mag_tsd', 'in7'),
-            ('tpl_bold_mag_tsfnr', 'in8'),
-            ('tpl_bold_mag_detrended', 'in9'),
-            ('tpl_bold_mag_tsfnr_roistats', 'in10'),
-            ('tpl_topup_b0_hz', 'in11'),
-            ('tpl_dropout', 'in12'),
-            ('motion_csv', 'in13'),
-            ('tpl_t1w_head', 'in14'),
-            ('tpl_t2w_head', 'in15'),
-            ('tpl_t1w_brain', 'in16'),
-            ('tpl_t2w_brain', 'in17'),
-            ('tpl_pseg', 'in18'),
-            ('tpl_dseg', 'in19'),
-            ('tpl_bmask', 'in20')
-        ]),
-
-        (deriv_file_list, deriv_sorter, [('out', 'file_list')]),
+        # Pass files to sorter
+        (inputnode, deriv_sorter, file_edges),
 
         # Create folder list and pass to sorter
-        (inputnode, deriv_folder_list, [
-            ('melodic_out_dir', 'in1')
-        ]),
+        (inputnode, deriv_folder_list, folder_edges),
 
         (deriv_folder_list, deriv_sorter, [('out', 'folder_list')]),
 
@@ -8,7 +8,6 @@ import nipype.interfaces.c3 as c3
 import nipype.interfaces.fsl as fsl
 import nipype.interfaces.utility as util
 import nipype.pipeline.engine as pe
-import numpy as np
 
 # fMRIprep (24.2.0) interfaces for one-shot resampling
 from fmriprep.interfaces.resampling import (ResampleSeries, DistortionParameters)
@@ -19,7 +18,7 @@ from niworkflows.interfaces.itk import MCFLIRT2ITK
 from ..workflows.topup_wf import build_topup_wf
 
 # Slabpreproc interfaces
-from ..interfaces import (TOPUPEncFile, LapUnwrap, ComplexPhaseDifference, SEEPIRef)
+from ..interfaces import (LapUnwrap, ComplexPhaseDifference, SEEPIRef)
 
 
 def build_func_preproc_wf(antsthreads=2):
@@ -83,7 +82,10 @@ def build_func_preproc_wf(antsthreads=2):
             save_mats=True,  # Save rigid transform matrices for single-shot, per-volume resampling
             save_plots=True
         ),
-        name='hmc_est'
+        name='hmc_est',
+        # Single-threaded FSL tool, independent of TOPUP estimation so MultiProc can overlap them
+        n_procs=1,
+        mem_gb=2.0
     )
 
     # Convert mcflirt HMC affine matrices to single ITK text file
@@ -100,7 +102,7 @@ def build_func_preproc_wf(antsthreads=2):
 
     # Identify warped SE-EPI fieldmap with same PE direction as warped SBRef
     # Used to calculate the rigid transform from SBRef to SE-EPI spaces for HMC and SDC
-    get_seepi_ref = pe.Node(SEEPIRef(), name='get_seepi_ref')
+    get_seepi_ref = pe.Node(SEEPIRef(), name='get_seepi_ref', run_without_submitting=True)
 
     # Setup TOPUP SDC workflow
     topup_wf = build_topup_wf(antsthreads=2)
@@ -46,7 +46,10 @@ from ..interfaces.summaryreport import SummaryReport
 # from .surface_wf import build_surface_wf
 
 
-def build_func_wf(bold_work_dir, deriv_dir, bold_meta, melodic=False, antsthreads=2):
+def build_func_wf(
+        bold_work_dir, deriv_dir, bold_meta,
+        melodic=False, antsthreads=2, melodic_report=True, reuse_report=False
+):
     """
     Build main subcortical QC workflow
 
@@ -60,6 +63,10 @@ def build_func_wf(bold_work_dir, deriv_dir, bold_meta, melodic=False, antsthread
         Melodic ICA run flag
     :param antsthreads: int
         Maximum number of threads allowed
+    :param melodic_report: bool
+        Generate MELODIC stats images and HTML report
+    :param reuse_report: bool
+        Keep an existing summary report PDF if its inputs and renderer are unchanged
     :return:
     """
 
@@ -101,12 +108,17 @@ def build_func_wf(bold_work_dir, deriv_dir, bold_meta, melodic=False, antsthread
     derivatives_wf = build_derivatives_wf(deriv_dir)
 
     # Optional MELODIC ICA workflow
-    melodic_wf = build_melodic_wf(tr_s=tr_s)
+    melodic_wf = build_melodic_wf(tr_s=tr_s, qc_report=melodic_report)
 
     # Summary report node
+    # Terminal node - nothing downstream waits on it, so under MultiProc it renders
+    # concurrently with derivatives sorting and any remaining QC/melodic nodes
+    # Single-threaded matplotlib/reportlab rendering of several template-space volumes
     summary_report = pe.Node(
-        SummaryReport(deriv_dir=deriv_dir),
-        overwrite=True,  # Always regenerate report
+        SummaryReport(deriv_dir=deriv_dir, skip_unchanged=reuse_report),
+        overwrite=True,  # Always rerun node - SummaryReport regenerates the PDF unless --reuse-report is set
+        n_procs=1,
+        mem_gb=1.0,
         name='summary_report'
     )
 
@@ -7,7 +7,16 @@ import nipype.pipeline.engine as pe
 from ..interfaces import MelMask
 
 
-def build_melodic_wf(tr_s=1.0):
+def build_melodic_wf(tr_s=1.0, qc_report=True):
+    """
+    Build MELODIC ICA workflow
+
+    :param tr_s: float
+        BOLD repetition time in seconds
+    :param qc_report: bool
+        Generate MELODIC component stats images and HTML report
+    :return:
+    """
 
     melodic_wf = pe.Workflow(name='melodic_wf')
 
@@ -35,8 +44,8 @@ def build_melodic_wf(tr_s=1.0):
             no_bet=True,
             tr_sec=tr_s,
             mm_thresh=0.5,
-            out_stats=True,
-            report=True,
+            out_stats=qc_report,
+            report=qc_report,
         ),
         name='melodic'
     )
@@ -3,14 +3,11 @@
 slab appropriate TOPUP SDC workflow for slabpreproc
 """
 
-import numpy as np
 import nipype.interfaces.utility as util
 import nipype.interfaces.fsl as fsl
-import nipype.interfaces.ants as ants
 import nipype.pipeline.engine as pe
 
 from ..interfaces import TOPUPEncFile
-from ..interfaces import SEEPIRef
 
 # For later single warp registration of BOLD volumes to individual structural space
 # from niworkflows.interfaces.itk import MCFLIRT2ITK
@@ -40,7 +37,7 @@ def build_topup_wf(antsthreads=2):
     # Create an encoding file for SE-EPI fmap correction with TOPUP
     # Use the corrected output from this node as a T2w intermediate reference
     # for registering the unwarped BOLD EPI slab space to the individual T2w template
-    seepi_enc_file = pe.Node(TOPUPEncFile(), name='seepi_enc_file')
+    seepi_enc_file = pe.Node(TOPUPEncFile(), name='seepi_enc_file', run_without_submitting=True)
 
     # Concatenate SE-EPI fieldmap mag images into a single 4D image
     # Required for FSL TOPUP implementation
@@ -50,7 +47,8 @@ def build_topup_wf(antsthreads=2):
     # This node also returns the corrected SE-EPI images used later for
     # registration of SE-EPI to SBRef space
     # Defaults to b02b0.cnf TOPUP config file
-    topup_est = pe.Node(fsl.TOPUP(output_type='NIFTI_GZ'), name='topup_est')
+    # Resource hints let MultiProc run this alongside HMC estimation in func_preproc_wf
+    topup_est = pe.Node(fsl.TOPUP(output_type='NIFTI_GZ'), name='topup_est', n_procs=1, mem_gb=2.0)
 
     # Average TOPUP unwarped AP/PA mag SE-EPIs
     seepi_uw_avg = pe.Node(